@@ -1,10 +1,16 @@
 import io
+import os
 from typing import Dict, List, Tuple
 
 import streamlit as st
 
 from plagiarism.compare import analyze_files
-from plagiarism.highlight import html_side_by_side_diff
+from plagiarism.highlight import html_region_view, html_side_by_side_diff
+from plagiarism.service import ServiceError, analyze_remote
+
+# When set, analysis jobs go to the shared job service (python -m plagiarism.service)
+SERVICE_URL = os.environ.get("PLAGIARISM_SERVICE_URL", "").strip()
+SERVICE_TIMEOUT = float(os.environ.get("PLAGIARISM_SERVICE_TIMEOUT", "600"))
 
 # --- New: Gemini API imports/config ---
 import google.generativeai as genai
@@ -131,10 +137,22 @@ def _render_upload_tab(settings: Dict) -> None:
                 return
             with st.spinner("Analyzing code for similarities..."):
                 files_map = {f["name"]: f["content"] for f in st.session_state.uploaded_files}
-                results = analyze_files(
-                    files_map,
-                    weights=settings["weights"],
-                )
+                if SERVICE_URL:
+                    try:
+                        results = analyze_remote(
+                            SERVICE_URL,
+                            files_map,
+                            weights=settings["weights"],
+                            timeout=SERVICE_TIMEOUT,
+                        )
+                    except (ServiceError, OSError) as exc:
+                        st.error(f"Analysis service error: {exc}")
+                        return
+                else:
+                    results = analyze_files(
+                        files_map,
+                        weights=settings["weights"],
+                    )
                 st.session_state.analysis_results = results
                 st.session_state.last_run_params = settings
             st.success("Analysis complete.")
@@ -187,12 +205,15 @@ def _render_results_tab(settings: Dict) -> None:
                     "Type-3": _format_pct(r["type3"]),
                     "Type-4": _format_pct(r["type4"]),
                     "Combined": _format_pct(r["combined"]),
+                    "Approximate": "≈" if r.get("approximate") else "",
                 }
                 for r in filtered_file_pairs
             ],
             use_container_width=True,
             hide_index=True,
         )
+        if any(r.get("approximate") for r in filtered_file_pairs):
+            st.caption("≈ marks oversized pairs scored with windowed matching.")
     else:
         st.info("No file pairs match the filters.")
 
@@ -220,6 +241,7 @@ def _render_results_tab(settings: Dict) -> None:
                     "Type-3": _format_pct(r["type3"]),
                     "Type-4": _format_pct(r["type4"]),
                     "Combined": _format_pct(r["combined"]),
+                    "Approximate": "≈" if r.get("approximate") else "",
                 }
                 for r in filtered_func_pairs
             ],
@@ -253,37 +275,119 @@ def _render_results_tab(settings: Dict) -> None:
         )
 
 
-def _render_viewer_tab() -> None:
-    results = st.session_state.analysis_results
-    if not results:
-        st.info("Run an analysis first in the Upload & Analyze tab.")
-        return
+VIEWER_PAGE_LINES = 200
 
-    func_pairs = results["function_pairs"]
-    if not func_pairs:
-        st.info("No function-level matches found.")
-        return
 
-    func_pairs_sorted = sorted(func_pairs, key=lambda r: r["combined"], reverse=True)
-    options = [
-        f"{r['file_a']}::{r['func_a']}  ↔  {r['file_b']}::{r['func_b']}  ({round(100*r['combined'],1)}%)"
-        for r in func_pairs_sorted
-    ]
-    choice = st.selectbox("Choose a function pair to view", options=options, index=0)
-    selected = func_pairs_sorted[options.index(choice)]
+@st.cache_data(show_spinner=False, max_entries=64)
+def _region_html(
+    source_a: str,
+    source_b: str,
+    regions: Tuple[Tuple[int, int, int, int], ...],
+    start: int,
+    start_b: int,
+    count: int,
+    title_a: str,
+    title_b: str,
+) -> str:
+    return html_region_view(
+        source_a, source_b, regions, start=start, count=count, title_a=title_a, title_b=title_b, start_b=start_b
+    )
 
-    left, right = st.columns(2)
-    with left:
-        st.caption(f"{selected['file_a']} :: {selected['func_a']}")
-    with right:
-        st.caption(f"{selected['file_b']} :: {selected['func_b']}")
 
-    html = html_side_by_side_diff(
-        selected["source_a"], selected["source_b"], context=True, numlines=2
+def _render_region_pages(source_a: str, source_b: str, regions: List, title_a: str, title_b: str, key: str) -> None:
+    """Paginated region view; long sources can be paged or aligned on a matched region."""
+    total = max(source_a.count("\n"), source_b.count("\n")) + 1
+    start = start_b = 0
+    if total > VIEWER_PAGE_LINES:
+        pages = (total + VIEWER_PAGE_LINES - 1) // VIEWER_PAGE_LINES
+        col_page, col_region = st.columns(2)
+        with col_page:
+            page = st.number_input(f"Page (of {pages})", 1, pages, 1, key=f"{key}_page")
+        with col_region:
+            region = st.selectbox(
+                "Align on matched region",
+                options=range(-1, len(regions)),
+                format_func=lambda i: "—" if i < 0 else (
+                    f"A {regions[i][0] + 1}-{regions[i][1] + 1}  ↔  B {regions[i][2] + 1}-{regions[i][3] + 1}"
+                ),
+                key=f"{key}_region",
+            )
+        if region >= 0:
+            start, start_b = regions[region][0], regions[region][2]
+        else:
+            start = start_b = (int(page) - 1) * VIEWER_PAGE_LINES
+    html = _region_html(
+        source_a,
+        source_b,
+        tuple(tuple(r) for r in regions),
+        start,
+        start_b,
+        VIEWER_PAGE_LINES,
+        title_a,
+        title_b,
     )
     st.components.v1.html(html, height=600, scrolling=True)
 
 
+def _render_viewer_tab(settings: Dict) -> None:
+    results = st.session_state.analysis_results
+    if not results:
+        st.info("Run an analysis first in the Upload & Analyze tab.")
+        return
+
+    mode = st.radio("View", ("Function pairs", "Whole files"), horizontal=True, key="viewer_mode")
+    # Results are already ranked by combined similarity; only the shown slice gets labels.
+    if mode == "Function pairs":
+        pairs = results["function_pairs"][: settings["max_pairs"]]
+        if not pairs:
+            st.info("No function-level matches found.")
+            return
+        idx = st.selectbox(
+            "Choose a function pair to view",
+            options=range(len(pairs)),
+            format_func=lambda i: (
+                f"{pairs[i]['file_a']}::{pairs[i]['func_a']}  ↔  {pairs[i]['file_b']}::{pairs[i]['func_b']}"
+                f"  ({round(100*pairs[i]['combined'],1)}%)"
+            ),
+            key="viewer_func_pair",
+        )
+        selected = pairs[idx]
+        source_a, source_b = selected["source_a"], selected["source_b"]
+        title_a = f"{selected['file_a']} :: {selected['func_a']}"
+        title_b = f"{selected['file_b']} :: {selected['func_b']}"
+    else:
+        pairs = results["file_pairs"][: settings["max_pairs"]]
+        if not pairs:
+            st.info("No file pairs found.")
+            return
+        idx = st.selectbox(
+            "Choose a file pair to view",
+            options=range(len(pairs)),
+            format_func=lambda i: (
+                f"{pairs[i]['file_a']}  ↔  {pairs[i]['file_b']}  ({round(100*pairs[i]['combined'],1)}%)"
+            ),
+            key="viewer_file_pair",
+        )
+        selected = pairs[idx]
+        sources = {f["name"]: f["content"] for f in st.session_state.uploaded_files}
+        if selected["file_a"] not in sources or selected["file_b"] not in sources:
+            st.info("Source files for this pair are no longer loaded.")
+            return
+        source_a, source_b = sources[selected["file_a"]], sources[selected["file_b"]]
+        title_a, title_b = selected["file_a"], selected["file_b"]
+
+    if "regions" not in selected:
+        # Results produced before region maps were recorded.
+        html = html_side_by_side_diff(source_a, source_b, context=True, numlines=2)
+        st.components.v1.html(html, height=600, scrolling=True)
+        return
+    regions = selected["regions"]
+    if regions is None:
+        st.warning("Matched regions were not recorded for this pair (input too large); showing it without highlights.")
+        regions = []
+    _render_region_pages(source_a, source_b, regions, title_a, title_b, key=f"viewer_{mode}_{idx}")
+
+
 # --- New: AI Text Detection UI ---
 
 def _render_ai_text_detection() -> None:
@@ -318,7 +422,7 @@ def main() -> None:  # pragma: no cover - Streamlit entry
         with tab_results:
             _render_results_tab(settings)
         with tab_viewer:
-            _render_viewer_tab()
+            _render_viewer_tab(settings)
     else:
         _render_ai_text_detection()
 
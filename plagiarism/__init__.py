@@ -7,4 +7,7 @@ __all__ = [
     "preprocess",
     "similarity",
     "compare",
+    "service",
+    "shard",
+    "watch",
 ]
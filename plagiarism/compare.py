@@ -2,11 +2,15 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from itertools import combinations
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from .preprocess import preprocess_for_type1, preprocess_for_type2, preprocess_for_type3
-from .ast_utils import get_functions
+from .ast_utils import FunctionInfo, get_functions
+from .token_utils import collapse_large_literals, line_signatures
 from .similarity import (
+    DEFAULT_BUDGET,
+    Budget,
+    matched_line_regions,
     type1_similarity,
     type2_similarity,
     type3_similarity,
@@ -15,6 +19,10 @@ from .similarity import (
 )
 
 
+# Bump whenever scores or the result shape change, so cached results are not reused.
+SCORING_VERSION = 4
+
+
 @dataclass
 class AnalyzedFile:
     name: str
@@ -22,23 +30,40 @@ class AnalyzedFile:
     t1: str
     t2: str
     t3: str
+    t4: str
+    lines: List[str]
+
+
+def _strip_literals(source: str, budget: Optional[Budget]) -> str:
+    if budget is None:
+        return source
+    return collapse_large_literals(source, budget.max_literal_tokens, budget.max_string_chars)
+
 
+def _prepare_source(name: str, source: str, budget: Optional[Budget] = DEFAULT_BUDGET) -> AnalyzedFile:
+    t4 = _strip_literals(source, budget)
+    t1 = preprocess_for_type1(t4)
+    t2, _ = preprocess_for_type2(t4)
+    t3 = preprocess_for_type3(t4)
+    lines = line_signatures(source)
+    return AnalyzedFile(name=name, source=source, t1=t1, t2=t2, t3=t3, t4=t4, lines=lines)
 
-def _prepare_files(files: Dict[str, str]) -> List[AnalyzedFile]:
-    prepared: List[AnalyzedFile] = []
-    for name, source in files.items():
-        t1 = preprocess_for_type1(source)
-        t2, _ = preprocess_for_type2(source)
-        t3 = preprocess_for_type3(source)
-        prepared.append(AnalyzedFile(name=name, source=source, t1=t1, t2=t2, t3=t3))
-    return prepared
 
+def _prepare_files(files: Dict[str, str], budget: Optional[Budget] = DEFAULT_BUDGET) -> List[AnalyzedFile]:
+    return [_prepare_source(name, source, budget) for name, source in files.items()]
 
-def _similarity_between_files(a: AnalyzedFile, b: AnalyzedFile, weights: Tuple[float, float, float, float]) -> Dict:
-    s1 = type1_similarity(a.t1, b.t1)
-    s2 = type2_similarity(a.t2, b.t2)
-    s3 = type3_similarity(a.t3, b.t3)
-    s4 = type4_similarity(a.source, b.source)
+
+def _prepare_functions(functions: List[FunctionInfo], budget: Optional[Budget] = DEFAULT_BUDGET) -> List[AnalyzedFile]:
+    """Preprocess each function once, so pairs reuse its features and line signatures."""
+    return [_prepare_source(fn.name, fn.source, budget) for fn in functions]
+
+
+def _similarity_between_files(a: AnalyzedFile, b: AnalyzedFile, weights: Tuple[float, float, float, float], budget: Optional[Budget] = DEFAULT_BUDGET) -> Dict:
+    pair = budget.start() if budget is not None else None
+    s1 = type1_similarity(a.t1, b.t1, pair)
+    s2 = type2_similarity(a.t2, b.t2, pair)
+    s3 = type3_similarity(a.t3, b.t3, pair)
+    s4 = type4_similarity(a.t4, b.t4, pair)
     return {
         "file_a": a.name,
         "file_b": b.name,
@@ -47,21 +72,20 @@ def _similarity_between_files(a: AnalyzedFile, b: AnalyzedFile, weights: Tuple[f
         "type3": s3,
         "type4": s4,
         "combined": combined_similarity(s1, s2, s3, s4, weights),
+        "approximate": bool(pair and pair.approximate),
+        "regions": matched_line_regions(a.lines, b.lines, budget),
     }
 
 
-def _similarity_between_functions(file_a: str, file_b: str, fa_source: str, fb_source: str, weights: Tuple[float, float, float, float], func_a_name: str, func_b_name: str) -> Dict:
-    t1a = preprocess_for_type1(fa_source)
-    t1b = preprocess_for_type1(fb_source)
-    t2a, _ = preprocess_for_type2(fa_source)
-    t2b, _ = preprocess_for_type2(fb_source)
-    t3a = preprocess_for_type3(fa_source)
-    t3b = preprocess_for_type3(fb_source)
+def _similarity_between_functions(file_a: str, file_b: str, fa_source: str, fb_source: str, weights: Tuple[float, float, float, float], func_a_name: str, func_b_name: str, budget: Optional[Budget] = DEFAULT_BUDGET, fa_prepared: Optional[AnalyzedFile] = None, fb_prepared: Optional[AnalyzedFile] = None) -> Dict:
+    pair = budget.start() if budget is not None else None
+    a = fa_prepared if fa_prepared is not None else _prepare_source(func_a_name, fa_source, budget)
+    b = fb_prepared if fb_prepared is not None else _prepare_source(func_b_name, fb_source, budget)
 
-    s1 = type1_similarity(t1a, t1b)
-    s2 = type2_similarity(t2a, t2b)
-    s3 = type3_similarity(t3a, t3b)
-    s4 = type4_similarity(fa_source, fb_source)
+    s1 = type1_similarity(a.t1, b.t1, pair)
+    s2 = type2_similarity(a.t2, b.t2, pair)
+    s3 = type3_similarity(a.t3, b.t3, pair)
+    s4 = type4_similarity(a.t4, b.t4, pair)
 
     return {
         "file_a": file_a,
@@ -73,27 +97,38 @@ def _similarity_between_functions(file_a: str, file_b: str, fa_source: str, fb_s
         "type3": s3,
         "type4": s4,
         "combined": combined_similarity(s1, s2, s3, s4, weights),
+        "approximate": bool(pair and pair.approximate),
+        "regions": matched_line_regions(a.lines, b.lines, budget),
         "source_a": fa_source,
         "source_b": fb_source,
     }
 
 
-def analyze_files(files: Dict[str, str], weights: Tuple[float, float, float, float] = (0.25, 0.25, 0.25, 0.25)) -> Dict:
-    prepared = _prepare_files(files)
+def analyze_files(files: Dict[str, str], weights: Tuple[float, float, float, float] = (0.25, 0.25, 0.25, 0.25), budget: Optional[Budget] = DEFAULT_BUDGET) -> Dict:
+    """Compare every file pair and every cross-file function pair.
+
+    ``budget`` bounds the work spent on any single pair; pairs scored with
+    windowed matching carry ``approximate=True``. Pass ``None`` for
+    exact, unbounded matching.
+    """
+    prepared = _prepare_files(files, budget)
 
     file_pairs: List[Dict] = []
     for a, b in combinations(prepared, 2):
-        file_pairs.append(_similarity_between_files(a, b, weights))
+        file_pairs.append(_similarity_between_files(a, b, weights, budget))
 
     function_pairs: List[Dict] = []
     file_to_functions = {name: get_functions(src, filename=name) for name, src in files.items()}
+    file_to_prepared = {name: _prepare_functions(funcs, budget) for name, funcs in file_to_functions.items()}
     names = list(files.keys())
     for i in range(len(names)):
         for j in range(i + 1, len(names)):
             fa_list = file_to_functions.get(names[i], [])
             fb_list = file_to_functions.get(names[j], [])
-            for fa in fa_list:
-                for fb in fb_list:
+            pa_list = file_to_prepared.get(names[i], [])
+            pb_list = file_to_prepared.get(names[j], [])
+            for fa, pa in zip(fa_list, pa_list):
+                for fb, pb in zip(fb_list, pb_list):
                     function_pairs.append(
                         _similarity_between_functions(
                             file_a=fa.filename,
@@ -103,6 +138,9 @@ def analyze_files(files: Dict[str, str], weights: Tuple[float, float, float, flo
                             weights=weights,
                             func_a_name=fa.name,
                             func_b_name=fb.name,
+                            budget=budget,
+                            fa_prepared=pa,
+                            fb_prepared=pb,
                         )
                     )
 
@@ -1,5 +1,21 @@
 from difflib import HtmlDiff
-from typing import Iterable
+from html import escape
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .token_utils import physical_lines
+
+# Background colours cycled across matched regions so pairs can be told apart.
+_REGION_COLOURS = ("#fff3b0", "#c8f7c5", "#cde7ff", "#ffd6e7", "#e3d7ff", "#ffe0c2")
+
+_REGION_STYLE = """
+<style>
+.rv { display: flex; gap: 8px; font-family: Menlo, Consolas, monospace; font-size: 12px; }
+.rv table { border-collapse: collapse; width: 50%; table-layout: fixed; }
+.rv td { padding: 0 4px; white-space: pre; overflow: hidden; text-overflow: ellipsis; vertical-align: top; }
+.rv td.n { width: 3.5em; color: #888; text-align: right; user-select: none; }
+.rv th { text-align: left; padding: 2px 4px; background: #f0f0f0; }
+</style>
+"""
 
 
 def html_side_by_side_diff(source_a: str, source_b: str, context: bool = True, numlines: int = 2) -> str:
@@ -20,3 +36,53 @@ def html_side_by_side_diff(source_a: str, source_b: str, context: bool = True, n
     b_lines: Iterable[str] = source_b.splitlines()
     differ = HtmlDiff(wrapcolumn=100)
     return differ.make_file(a_lines, b_lines, "A", "B", context=context, numlines=numlines)
+
+
+def _line_colours(regions: Sequence[Sequence[int]], side: int) -> Dict[int, str]:
+    colours: Dict[int, str] = {}
+    for idx, region in enumerate(regions):
+        start, end = region[2 * side], region[2 * side + 1]
+        colour = _REGION_COLOURS[idx % len(_REGION_COLOURS)]
+        for line in range(start, end + 1):
+            colours[line] = colour
+    return colours
+
+
+def _render_pane(title: str, lines: List[str], colours: Dict[int, str], start: int, stop: int) -> str:
+    rows = [f"<tr><th colspan='2'>{escape(title)}</th></tr>"]
+    for line in range(start, min(stop, len(lines))):
+        colour = colours.get(line)
+        style = f" style='background:{colour}'" if colour else ""
+        rows.append(f"<tr{style}><td class='n'>{line + 1}</td><td>{escape(lines[line])}</td></tr>")
+    return "<table>" + "".join(rows) + "</table>"
+
+
+def html_region_view(
+    source_a: str,
+    source_b: str,
+    regions: Sequence[Sequence[int]],
+    start: int = 0,
+    count: Optional[int] = None,
+    title_a: str = "A",
+    title_b: str = "B",
+    start_b: Optional[int] = None,
+) -> str:
+    """Render two sources side by side with precomputed matched regions highlighted.
+
+    ``regions`` holds ``[a_start, a_end, b_start, b_end]`` entries (0-based,
+    inclusive) as produced by ``matched_line_regions``. Corresponding regions
+    share a colour. Only ``count`` lines of each side are rendered, beginning at
+    ``start`` (and ``start_b`` on the right, if given), which keeps large files
+    cheap to page through.
+    """
+    a_lines = [line.rstrip("\r\n") for line in physical_lines(source_a)]
+    b_lines = [line.rstrip("\r\n") for line in physical_lines(source_b)]
+    start_b = start if start_b is None else start_b
+    count = max(len(a_lines), len(b_lines)) if count is None else count
+    return (
+        _REGION_STYLE
+        + "<div class='rv'>"
+        + _render_pane(title_a, a_lines, _line_colours(regions, 0), start, start + count)
+        + _render_pane(title_b, b_lines, _line_colours(regions, 1), start_b, start_b + count)
+        + "</div>"
+    )
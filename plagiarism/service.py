@@ -0,0 +1,398 @@
+"""Local HTTP job service that queues ``analyze_files`` runs onto a process pool.
+
+Run with ``python -m plagiarism.service --workers 4``. Endpoints:
+
+* ``POST /jobs`` with ``{"files": {name: source}, "weights": [w1, w2, w3, w4]}``
+* ``GET /jobs/<job_id>`` for the job status
+* ``GET /jobs/<job_id>/result`` for the finished analysis
+* ``GET /health``
+
+Identical submissions share one job id (a hash of files, weights, budget and
+scoring version), and finished results are persisted so they survive a
+service restart.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict
+from typing import Dict, Optional, Tuple
+
+from .compare import SCORING_VERSION, analyze_files
+from .similarity import DEFAULT_BUDGET, Budget
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_RESULTS_DIR = ".plagiarism_jobs"
+
+_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class ServiceError(Exception):
+    """Raised by the client helpers when the service rejects a request."""
+
+
+def job_key(
+    files: Dict[str, str],
+    weights: Tuple[float, float, float, float],
+    budget: Optional[Budget] = DEFAULT_BUDGET,
+) -> str:
+    """Content hash of a job, including the scoring version and budget."""
+    payload = json.dumps(
+        {
+            "version": SCORING_VERSION,
+            "budget": asdict(budget) if budget is not None else None,
+            "files": sorted(files.items()),
+            "weights": [float(w) for w in weights],
+        },
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    """One JSON file per finished job, written atomically.
+
+    Results older than ``max_age`` seconds are treated as missing and deleted.
+    """
+
+    def __init__(self, root: str, max_age: Optional[float] = None) -> None:
+        self.root = root
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def has(self, key: str) -> bool:
+        path = self._path(key)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        if self.max_age is None or time.time() - mtime <= self.max_age:
+            return True
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+    def load(self, key: str) -> Optional[Dict]:
+        if not self.has(key):
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, result: Dict) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(result, fh)
+        os.replace(tmp, path)
+
+
+class JobScheduler:
+    """Deduplicating front end for a bounded ``ProcessPoolExecutor``."""
+
+    def __init__(
+        self,
+        store: ResultStore,
+        workers: Optional[int] = None,
+        max_pending: int = 64,
+        budget: Optional[Budget] = DEFAULT_BUDGET,
+        max_status: int = 1024,
+    ) -> None:
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.budget = budget
+        self.max_status = max_status
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Only as many jobs as workers are handed to the pool, so a worker dying
+        # breaks the pool for those jobs alone, not for everything queued.
+        self._slots = asyncio.Semaphore(self.workers)
+        # Finished entries are evicted oldest first; done results stay on disk.
+        self._status: "OrderedDict[str, Dict]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, files: Dict[str, str], weights: Tuple[float, float, float, float]) -> Optional[str]:
+        """Queue a job and return its id, or ``None`` when the queue is full."""
+        key = job_key(files, weights, self.budget)
+        if key in self._tasks or self.store.has(key):
+            return key
+        if self.pending() >= self.max_pending:
+            return None
+        self._set_status(key, {"status": "queued", "submitted": time.time()})
+        self._tasks[key] = asyncio.get_running_loop().create_task(self._run(key, files, weights))
+        return key
+
+    def _set_status(self, key: str, status: Dict) -> None:
+        self._status[key] = status
+        self._status.move_to_end(key)
+        while len(self._status) > self.max_status:
+            oldest = next(iter(self._status))
+            if oldest in self._tasks:
+                # Only in-flight jobs left beyond the limit; they are bounded by max_pending.
+                break
+            del self._status[oldest]
+
+    def _replace_broken_pool(self, executor: ProcessPoolExecutor) -> None:
+        if self._executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def _run(self, key: str, files: Dict[str, str], weights: Tuple[float, float, float, float]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._slots:
+                self._set_status(key, {"status": "running"})
+                executor = self._executor
+                try:
+                    result = await loop.run_in_executor(executor, analyze_files, files, weights, self.budget)
+                except BrokenProcessPool:
+                    self._replace_broken_pool(executor)
+                    # Every job sharing the pool with a dying worker lands here.
+                    # Retry each one in a pool of its own, so only the job that
+                    # actually kills a worker fails.
+                    with ProcessPoolExecutor(max_workers=1) as retry:
+                        try:
+                            result = await loop.run_in_executor(retry, analyze_files, files, weights, self.budget)
+                        except BrokenProcessPool as exc:
+                            self._set_status(key, {"status": "failed", "error": f"worker process died: {exc}"})
+                            return
+            await loop.run_in_executor(None, self.store.save, key, result)
+            self._set_status(key, {"status": "done"})
+        except Exception as exc:
+            self._set_status(key, {"status": "failed", "error": f"{type(exc).__name__}: {exc}"})
+        finally:
+            self._tasks.pop(key, None)
+
+    def status(self, key: str) -> Optional[Dict]:
+        if key in self._status:
+            status = self._status[key]
+            if status["status"] != "done" or self.store.has(key):
+                return dict(status)
+            # The stored result expired; forget the job.
+            del self._status[key]
+            return None
+        if self.store.has(key):
+            return {"status": "done"}
+        return None
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class JobServer:
+    """Minimal HTTP/1.1 front end over ``asyncio.start_server``."""
+
+    def __init__(self, scheduler: JobScheduler, max_body: int = 64 * 1024 * 1024) -> None:
+        self.scheduler = scheduler
+        self.max_body = max_body
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            code, body = await self._dispatch(reader)
+        except Exception as exc:
+            code, body = 500, {"error": f"{type(exc).__name__}: {exc}"}
+        data = json.dumps(body).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {code} {_REASONS.get(code, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("ascii") + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader: asyncio.StreamReader) -> Tuple[int, Dict]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            return 400, {"error": "malformed request line"}
+        method, path, _ = parts
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        segments = [s for s in path.split("?", 1)[0].split("/") if s]
+        if segments == ["health"]:
+            return 200, {"status": "ok", "workers": self.scheduler.workers, "pending": self.scheduler.pending()}
+        if segments == ["jobs"]:
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                length = int(headers.get("content-length", "0") or 0)
+            except ValueError:
+                return 400, {"error": "invalid Content-Length"}
+            if length < 0:
+                return 400, {"error": "invalid Content-Length"}
+            if length > self.max_body:
+                return 413, {"error": "request body too large"}
+            try:
+                raw = await reader.readexactly(length) if length else b""
+            except asyncio.IncompleteReadError:
+                return 400, {"error": "request body shorter than Content-Length"}
+            return self._submit(raw)
+        if len(segments) in (2, 3) and segments[0] == "jobs":
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            key = segments[1]
+            if len(segments) == 2:
+                status = self.scheduler.status(key)
+                if status is None:
+                    return 404, {"error": "unknown job"}
+                return 200, {"job_id": key, **status}
+            if segments[2] == "result":
+                return self._result(key)
+        return 404, {"error": "not found"}
+
+    def _submit(self, raw: bytes) -> Tuple[int, Dict]:
+        try:
+            payload = json.loads(raw.decode("utf-8"))
+            files = payload["files"]
+            raw_weights = payload.get("weights", [0.25, 0.25, 0.25, 0.25])
+        except (ValueError, KeyError, TypeError):
+            return 400, {"error": "expected JSON with 'files' and optional 'weights'"}
+        if not isinstance(files, dict) or not all(isinstance(v, str) for v in files.values()):
+            return 400, {"error": "'files' must map file names to source strings"}
+        if not (
+            isinstance(raw_weights, list)
+            and len(raw_weights) == 4
+            and all(isinstance(w, (int, float)) and not isinstance(w, bool) for w in raw_weights)
+        ):
+            return 400, {"error": "'weights' must be a list of four numbers"}
+        weights = (float(raw_weights[0]), float(raw_weights[1]), float(raw_weights[2]), float(raw_weights[3]))
+        key = self.scheduler.submit(files, weights)
+        if key is None:
+            return 503, {"error": "job queue is full"}
+        return 202, {"job_id": key, **(self.scheduler.status(key) or {})}
+
+    def _result(self, key: str) -> Tuple[int, Dict]:
+        status = self.scheduler.status(key)
+        if status is None:
+            return 404, {"error": "unknown job"}
+        if status["status"] != "done":
+            return 409, {"job_id": key, **status}
+        result = self.scheduler.store.load(key)
+        if result is None:
+            return 500, {"error": "stored result is unreadable"}
+        return 200, result
+
+
+async def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: Optional[int] = None,
+    results_dir: str = DEFAULT_RESULTS_DIR,
+    max_pending: int = 64,
+    result_ttl: Optional[float] = None,
+) -> None:
+    scheduler = JobScheduler(ResultStore(results_dir, max_age=result_ttl), workers=workers, max_pending=max_pending)
+    server = await asyncio.start_server(JobServer(scheduler).handle, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        scheduler.shutdown()
+
+
+# --- Client helpers ---
+
+def _request(url: str, data: Optional[Dict] = None, timeout: float = 30.0) -> Tuple[int, Dict]:
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    req = urllib.request.Request(
+        url,
+        data=body,
+        method="POST" if body is not None else "GET",
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as exc:
+        try:
+            return exc.code, json.loads(exc.read().decode("utf-8"))
+        except ValueError:
+            return exc.code, {"error": exc.reason}
+
+
+def submit_job(base_url: str, files: Dict[str, str], weights: Tuple[float, float, float, float]) -> str:
+    code, body = _request(f"{base_url.rstrip('/')}/jobs", {"files": files, "weights": list(weights)})
+    if code != 202:
+        raise ServiceError(body.get("error", f"HTTP {code}"))
+    return body["job_id"]
+
+
+def analyze_remote(
+    base_url: str,
+    files: Dict[str, str],
+    weights: Tuple[float, float, float, float] = (0.25, 0.25, 0.25, 0.25),
+    poll_interval: float = 0.5,
+    timeout: Optional[float] = None,
+) -> Dict:
+    """Submit a job to the service and block until its result is available."""
+    base = base_url.rstrip("/")
+    key = submit_job(base, files, weights)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        code, body = _request(f"{base}/jobs/{key}/result")
+        if code == 200:
+            return body
+        if code != 409 or body.get("status") == "failed":
+            raise ServiceError(body.get("error", f"HTTP {code}"))
+        if deadline is not None and time.monotonic() > deadline:
+            raise ServiceError(f"job {key} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+
+
+def main() -> None:  # pragma: no cover - CLI entry
+    parser = argparse.ArgumentParser(description="Run the local plagiarism analysis job service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--results-dir", default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--max-pending", type=int, default=64, help="reject new jobs beyond this many in flight")
+    parser.add_argument("--result-ttl", type=float, default=None, help="seconds before a stored result is recomputed")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.results_dir, args.max_pending, args.result_ttl))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
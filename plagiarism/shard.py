@@ -0,0 +1,464 @@
+"""Sharded all-pairs analysis over block tiles of the file pair matrix.
+
+The workflow splits ``analyze_files`` into steps that can run on separate
+machines sharing a directory:
+
+1. ``prepare`` preprocesses every file once and writes a JSON-lines feature
+   file (one record per file) plus a ``.idx`` file of record offsets, so a
+   tile reads only the rows it compares.
+2. ``plan`` writes ``manifest.json`` into the output directory (features hash,
+   file count, tile size, weights, top-K, cluster threshold) and lists the
+   upper-triangular tiles.
+3. ``run`` processes tiles by index and writes ``tile_<i0>_<j0>.json``: its
+   top-K pairs plus every file pair at or above the cluster threshold. Tiles
+   already written for the same manifest are skipped, so a failed run is
+   restarted by simply running the same tiles again. A directory planned with
+   different settings is refused rather than mixed.
+4. ``merge`` combines the planned tiles into a global top-K, clusters files
+   over the union of all tile edges, and refuses to run while any tile is
+   missing.
+
+``run-local`` plans and executes every pending tile with a local process pool,
+which is convenient for testing the same path on one machine.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .ast_utils import FunctionInfo, get_functions
+from .compare import (
+    SCORING_VERSION,
+    AnalyzedFile,
+    _prepare_files,
+    _prepare_functions,
+    _similarity_between_files,
+    _similarity_between_functions,
+)
+
+Tile = Tuple[int, int, int, int]
+
+DEFAULT_TILE_SIZE = 64
+DEFAULT_TOP_K = 500
+DEFAULT_CLUSTER_THRESHOLD = 0.8
+MANIFEST_NAME = "manifest.json"
+
+
+def _write_json(path: str, data: Dict) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _index_path(features_path: str) -> str:
+    return f"{features_path}.idx"
+
+
+def prepare_features(files: Dict[str, str], path: str) -> int:
+    """Preprocess ``files`` once and write the shared feature file. Returns the file count.
+
+    Each file is one JSON line; ``<path>.idx`` holds the ``n + 1`` byte offsets
+    of those lines as little-endian 64-bit integers.
+    """
+    offsets = [0]
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        for item in _prepare_files(files):
+            entry = asdict(item)
+            entry["functions"] = [asdict(fn) for fn in get_functions(item.source, filename=item.name)]
+            fh.write(json.dumps(entry).encode("utf-8") + b"\n")
+            offsets.append(fh.tell())
+    index_tmp = f"{_index_path(path)}.{os.getpid()}.tmp"
+    with open(index_tmp, "wb") as fh:
+        fh.write(struct.pack(f"<{len(offsets)}q", *offsets))
+    os.replace(tmp, path)
+    os.replace(index_tmp, _index_path(path))
+    return len(offsets) - 1
+
+
+def _feature_count(path: str) -> int:
+    return os.path.getsize(_index_path(path)) // 8 - 1
+
+
+def load_features(
+    path: str, start: int = 0, stop: Optional[int] = None
+) -> Tuple[List[AnalyzedFile], List[List[FunctionInfo]]]:
+    """Load feature rows ``start:stop`` without reading the rest of the file."""
+    if stop is None:
+        stop = _feature_count(path)
+    prepared: List[AnalyzedFile] = []
+    functions: List[List[FunctionInfo]] = []
+    if stop <= start:
+        return prepared, functions
+    with open(_index_path(path), "rb") as fh:
+        fh.seek(start * 8)
+        offsets = struct.unpack(f"<{stop - start + 1}q", fh.read((stop - start + 1) * 8))
+    with open(path, "rb") as fh:
+        fh.seek(offsets[0])
+        data = fh.read(offsets[-1] - offsets[0])
+    for line in data.splitlines():
+        entry = json.loads(line)
+        functions.append([FunctionInfo(**fn) for fn in entry.pop("functions", [])])
+        prepared.append(AnalyzedFile(**entry))
+    return prepared, functions
+
+
+def plan_tiles(n: int, tile_size: int = DEFAULT_TILE_SIZE) -> List[Tile]:
+    """Return ``(i0, i1, j0, j1)`` blocks covering every pair ``i < j`` exactly once."""
+    if tile_size <= 0:
+        raise ValueError("tile_size must be positive")
+    starts = list(range(0, n, tile_size))
+    tiles: List[Tile] = []
+    for bi, i0 in enumerate(starts):
+        for j0 in starts[bi:]:
+            tiles.append((i0, min(i0 + tile_size, n), j0, min(j0 + tile_size, n)))
+    return tiles
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_path(out_dir: str) -> str:
+    return os.path.join(out_dir, MANIFEST_NAME)
+
+
+def load_manifest(out_dir: str) -> Dict:
+    path = _manifest_path(out_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run 'plan' first")
+    return _read_json(path)
+
+
+def write_manifest(
+    features_path: str,
+    out_dir: str,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    weights: Tuple[float, float, float, float] = (0.25, 0.25, 0.25, 0.25),
+    top_k: int = DEFAULT_TOP_K,
+    cluster_threshold: float = DEFAULT_CLUSTER_THRESHOLD,
+) -> Dict:
+    """Record the run settings in ``out_dir``, or check them against an existing manifest."""
+    manifest = {
+        "features_sha256": _file_digest(features_path),
+        "features_size": os.path.getsize(features_path),
+        "n": _feature_count(features_path),
+        "tile_size": tile_size,
+        "weights": [float(w) for w in weights],
+        "top_k": top_k,
+        "cluster_threshold": float(cluster_threshold),
+        "scoring_version": SCORING_VERSION,
+    }
+    manifest["run_id"] = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    path = _manifest_path(out_dir)
+    if os.path.exists(path):
+        existing = _read_json(path)
+        if existing.get("run_id") != manifest["run_id"]:
+            raise ValueError(
+                f"{out_dir} was planned with different features or settings; use a fresh output directory"
+            )
+        return existing
+    os.makedirs(out_dir, exist_ok=True)
+    _write_json(path, manifest)
+    return manifest
+
+
+def _checked_manifest(features_path: str, out_dir: str, verify_digest: bool = True) -> Dict:
+    """Load the manifest and check ``features_path`` against it.
+
+    The size is always compared; the full SHA-256 only when ``verify_digest``
+    is set, so callers running many tiles hash the feature file once.
+    """
+    manifest = load_manifest(out_dir)
+    if os.path.getsize(features_path) != manifest["features_size"] or (
+        verify_digest and _file_digest(features_path) != manifest["features_sha256"]
+    ):
+        raise ValueError(f"{features_path} does not match the features {out_dir} was planned with")
+    return manifest
+
+
+def verify_features(features_path: str, out_dir: str) -> None:
+    """Raise ``ValueError`` unless ``features_path`` is the file ``out_dir`` was planned with."""
+    _checked_manifest(features_path, out_dir)
+
+
+def tile_path(out_dir: str, tile: Tile) -> str:
+    return os.path.join(out_dir, f"tile_{tile[0]}_{tile[2]}.json")
+
+
+def _tile_done(out_dir: str, tile: Tile, run_id: str) -> bool:
+    try:
+        return _read_json(tile_path(out_dir, tile)).get("run_id") == run_id
+    except (OSError, ValueError):
+        return False
+
+
+def _top_k(rows: Iterable[Dict], k: int) -> List[Dict]:
+    return heapq.nlargest(k, rows, key=lambda r: r["combined"])
+
+
+def run_tile(features_path: str, out_dir: str, index: int, force: bool = False, verified: bool = False) -> str:
+    """Compare every pair inside planned tile ``index`` and write its partial result.
+
+    Only the tile's rows are read from the feature file. Pass ``verified=True``
+    after ``verify_features`` to skip re-hashing the feature file per tile.
+    """
+    manifest = _checked_manifest(features_path, out_dir, verify_digest=not verified)
+    tiles = plan_tiles(manifest["n"], manifest["tile_size"])
+    if not 0 <= index < len(tiles):
+        raise IndexError(f"tile index {index} out of range (plan has {len(tiles)} tiles)")
+    tile = tiles[index]
+    path = tile_path(out_dir, tile)
+    if not force and _tile_done(out_dir, tile, manifest["run_id"]):
+        return path
+
+    weights = tuple(manifest["weights"])
+    top_k = manifest["top_k"]
+    threshold = manifest["cluster_threshold"]
+    i0, i1, j0, j1 = tile
+    rows_i, functions_i = load_features(features_path, i0, i1)
+    if j0 == i0:
+        rows_j, functions_j = rows_i, functions_i
+    else:
+        rows_j, functions_j = load_features(features_path, j0, j1)
+    prepared_i = [_prepare_functions(funcs) for funcs in functions_i]
+    prepared_j = prepared_i if j0 == i0 else [_prepare_functions(funcs) for funcs in functions_j]
+    file_pairs: List[Dict] = []
+    function_pairs: List[Dict] = []
+    edges: List[List] = []
+    compared = 0
+    for i in range(i0, i1):
+        for j in range(max(j0, i + 1), j1):
+            compared += 1
+            row = _similarity_between_files(rows_i[i - i0], rows_j[j - j0], weights)
+            file_pairs.append(row)
+            if row["combined"] >= threshold:
+                edges.append([row["file_a"], row["file_b"]])
+            for fa, pa in zip(functions_i[i - i0], prepared_i[i - i0]):
+                for fb, pb in zip(functions_j[j - j0], prepared_j[j - j0]):
+                    function_pairs.append(
+                        _similarity_between_functions(
+                            file_a=fa.filename,
+                            file_b=fb.filename,
+                            fa_source=fa.source,
+                            fb_source=fb.source,
+                            weights=weights,
+                            func_a_name=fa.name,
+                            func_b_name=fb.name,
+                            fa_prepared=pa,
+                            fb_prepared=pb,
+                        )
+                    )
+            # Keep memory bounded on dense tiles.
+            if len(function_pairs) > 4 * top_k:
+                function_pairs = _top_k(function_pairs, top_k)
+
+    _write_json(
+        path,
+        {
+            "run_id": manifest["run_id"],
+            "tile": list(tile),
+            "pairs_compared": compared,
+            "file_pairs": _top_k(file_pairs, top_k),
+            "function_pairs": _top_k(function_pairs, top_k),
+            "edges": edges,
+        },
+    )
+    return path
+
+
+def pending_tiles(out_dir: str) -> List[int]:
+    """Indices of planned tiles without an output for the current manifest."""
+    manifest = load_manifest(out_dir)
+    tiles = plan_tiles(manifest["n"], manifest["tile_size"])
+    return [idx for idx, tile in enumerate(tiles) if not _tile_done(out_dir, tile, manifest["run_id"])]
+
+
+def run_local(
+    features_path: str,
+    out_dir: str,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    processes: Optional[int] = None,
+    weights: Tuple[float, float, float, float] = (0.25, 0.25, 0.25, 0.25),
+    top_k: int = DEFAULT_TOP_K,
+    cluster_threshold: float = DEFAULT_CLUSTER_THRESHOLD,
+) -> List[str]:
+    """Plan ``out_dir`` and run all missing tiles with a local process pool."""
+    write_manifest(features_path, out_dir, tile_size, weights, top_k, cluster_threshold)
+    verify_features(features_path, out_dir)
+    todo = pending_tiles(out_dir)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_tile, features_path, out_dir, idx, False, True) for idx in todo]
+        return [f.result() for f in futures]
+
+
+def cluster_files(file_pairs: Iterable[Dict], threshold: float) -> List[List[str]]:
+    """Group files connected by pairs at or above ``threshold`` (largest first)."""
+    return cluster_edges((row["file_a"], row["file_b"]) for row in file_pairs if row["combined"] >= threshold)
+
+
+def cluster_edges(edges: Iterable[Tuple[str, str]]) -> List[List[str]]:
+    """Group files connected by ``(file_a, file_b)`` edges (largest first)."""
+    parent: Dict[str, str] = {}
+
+    def find(x: str) -> str:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for file_a, file_b in edges:
+        ra, rb = find(file_a), find(file_b)
+        if ra != rb:
+            parent[rb] = ra
+
+    groups: Dict[str, List[str]] = {}
+    for name in parent:
+        groups.setdefault(find(name), []).append(name)
+    clusters = [sorted(g) for g in groups.values() if len(g) > 1]
+    clusters.sort(key=lambda g: (-len(g), g[0]))
+    return clusters
+
+
+def merge_tiles(out_dir: str) -> Dict:
+    """Combine the planned tile outputs into the ``analyze_files`` result shape plus clusters.
+
+    Raises ``FileNotFoundError`` while any planned tile is missing or was written
+    for a different manifest. Clusters are the union of every tile's edges at the
+    manifest's ``cluster_threshold``, not just of the pairs that made the top-K.
+    """
+    manifest = load_manifest(out_dir)
+    missing = pending_tiles(out_dir)
+    if missing:
+        raise FileNotFoundError(f"{len(missing)} tile(s) not finished, e.g. index {missing[0]}")
+
+    top_k = manifest["top_k"]
+    file_pairs: List[Dict] = []
+    function_pairs: List[Dict] = []
+    edges: List[Tuple[str, str]] = []
+    compared = 0
+    tiles = plan_tiles(manifest["n"], manifest["tile_size"])
+    for tile in tiles:
+        data = _read_json(tile_path(out_dir, tile))
+        compared += data.get("pairs_compared", 0)
+        edges.extend((a, b) for a, b in data["edges"])
+        file_pairs = _top_k(file_pairs + data["file_pairs"], top_k)
+        function_pairs = _top_k(function_pairs + data["function_pairs"], top_k)
+
+    return {
+        "file_pairs": file_pairs,
+        "function_pairs": function_pairs,
+        "clusters": cluster_edges(edges),
+        "tiles": len(tiles),
+        "pairs_compared": compared,
+    }
+
+
+def _read_sources(paths: Iterable[str]) -> Dict[str, str]:
+    files: Dict[str, str] = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+            files[path] = fh.read()
+    return files
+
+
+def _parse_weights(text: str) -> Tuple[float, float, float, float]:
+    parts = [float(p) for p in text.split(",")]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("weights must be four comma-separated numbers")
+    return parts[0], parts[1], parts[2], parts[3]
+
+
+def main(argv: Optional[List[str]] = None) -> None:  # pragma: no cover - CLI entry
+    parser = argparse.ArgumentParser(description="Sharded block-tile plagiarism analysis.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("prepare", help="write the shared feature file")
+    p.add_argument("features")
+    p.add_argument("sources", nargs="+")
+
+    p = sub.add_parser("plan", help="write the run manifest and print tile indices")
+    p.add_argument("features")
+    p.add_argument("out_dir")
+    p.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE)
+    p.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    p.add_argument("--weights", type=_parse_weights, default=(0.25, 0.25, 0.25, 0.25))
+    p.add_argument("--cluster-threshold", type=float, default=DEFAULT_CLUSTER_THRESHOLD)
+
+    p = sub.add_parser("run", help="process planned tiles by index")
+    p.add_argument("features")
+    p.add_argument("out_dir")
+    p.add_argument("--tile", type=int, action="append", required=True, help="tile index from 'plan'")
+    p.add_argument("--force", action="store_true", help="recompute even if the tile output exists")
+
+    p = sub.add_parser("run-local", help="plan and run every pending tile locally")
+    p.add_argument("features")
+    p.add_argument("out_dir")
+    p.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE)
+    p.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    p.add_argument("--weights", type=_parse_weights, default=(0.25, 0.25, 0.25, 0.25))
+    p.add_argument("--cluster-threshold", type=float, default=DEFAULT_CLUSTER_THRESHOLD)
+    p.add_argument("--processes", type=int, default=None)
+
+    p = sub.add_parser("merge", help="combine tile outputs (fails if any tile is missing)")
+    p.add_argument("out_dir")
+    p.add_argument("--output", default="-")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.cmd == "prepare":
+            print(prepare_features(_read_sources(args.sources), args.features))
+        elif args.cmd == "plan":
+            manifest = write_manifest(
+                args.features, args.out_dir, args.tile_size, args.weights, args.top_k, args.cluster_threshold
+            )
+            for idx, tile in enumerate(plan_tiles(manifest["n"], manifest["tile_size"])):
+                print(idx, *tile)
+        elif args.cmd == "run":
+            verify_features(args.features, args.out_dir)
+            for idx in args.tile:
+                print(run_tile(args.features, args.out_dir, idx, args.force, verified=True))
+        elif args.cmd == "run-local":
+            paths = run_local(
+                args.features,
+                args.out_dir,
+                args.tile_size,
+                args.processes,
+                args.weights,
+                args.top_k,
+                args.cluster_threshold,
+            )
+            for path in paths:
+                print(path)
+        else:
+            merged = merge_tiles(args.out_dir)
+            text = json.dumps(merged, indent=2)
+            if args.output == "-":
+                print(text)
+            else:
+                with open(args.output, "w", encoding="utf-8") as fh:
+                    fh.write(text)
+    except (ValueError, IndexError, FileNotFoundError) as exc:
+        parser.exit(1, f"error: {exc}\n")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -1,35 +1,186 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from difflib import SequenceMatcher
-from typing import Iterable, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 from .ast_utils import ast_structure_signature, sequence_similarity
 from .token_utils import tokenize_code
 
 
-def _ratio(a: str, b: str) -> float:
+@dataclass(frozen=True)
+class Budget:
+    """Per-pair size limits for similarity scoring.
+
+    Strings longer than ``max_len`` characters, and token or AST-tag lists longer
+    than ``max_tokens``, are matched window by window instead of as a whole.
+    Token lists get the smaller limit because ``SequenceMatcher`` degrades much
+    faster on them than on characters; line-signature lists used for matched
+    regions are windowed the same way, and regions are skipped entirely above
+    ``max_region_lines``. Limits depend only on input size, so the same pair
+    always gets the same score. Literal blocks above
+    ``max_literal_tokens`` / ``max_string_chars`` are collapsed before matching
+    (see ``collapse_large_literals``).
+    """
+
+    max_len: int = 20000
+    window: int = 4000
+    max_tokens: int = 3000
+    token_window: int = 1000
+    max_literal_tokens: int = 200
+    max_string_chars: int = 2000
+    max_region_lines: int = 50000
+
+    def start(self) -> "PairBudget":
+        return PairBudget(self)
+
+
+class PairBudget:
+    """Budget plus ``approximate`` flag for scoring a single pair."""
+
+    def __init__(self, budget: Budget) -> None:
+        self.budget = budget
+        self.approximate = False
+
+
+DEFAULT_BUDGET = Budget()
+
+
+def _windows(seq: Sequence, size: int) -> List[Sequence]:
+    """Split ``seq`` into windows of about ``size`` elements; strings break on line ends."""
+    if not isinstance(seq, str):
+        return [seq[i:i + size] for i in range(0, len(seq), size)] or [seq[:0]]
+    out: List[str] = []
+    current: List[str] = []
+    length = 0
+    for line in seq.splitlines(keepends=True):
+        current.append(line)
+        length += len(line)
+        if length >= size:
+            out.append("".join(current))
+            current, length = [], 0
+    if current or not out:
+        out.append("".join(current))
+    return out
+
+
+def _matches(a: Sequence, b: Sequence) -> float:
+    """Number of matched elements between ``a`` and ``b`` (``ratio * (len_a + len_b) / 2``)."""
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(a=a, b=b).ratio() * (len(a) + len(b)) / 2.0
+
+
+def _bounded_ratio(a: Sequence, b: Sequence, pair: PairBudget) -> float:
+    if not a and not b:
+        return 1.0
+    text = isinstance(a, str)
+    limit = pair.budget.max_len if text else pair.budget.max_tokens
+    if len(a) <= limit and len(b) <= limit:
+        return float(SequenceMatcher(a=a, b=b).ratio())
+
+    pair.approximate = True
+    size = pair.budget.window if text else pair.budget.token_window
+    wa = _windows(a, size)
+    wb = _windows(b, size)
+    matched = sum(found for _, _, found in _align_windows(wa, wb, _matches))
+    return min(1.0, 2.0 * matched / (len(a) + len(b)))
+
+
+def _align_windows(wa: List[Sequence], wb: List[Sequence], score: Callable[[Sequence, Sequence], float]) -> List[Tuple[int, int, float]]:
+    """Pair each window of ``a`` with the best-scoring of the nearest windows of ``b``.
+
+    ``b`` windows are never reused or revisited, so the chosen pairs form one
+    order-preserving alignment; unlike ``quick_ratio`` this cannot reward
+    reordered content.
+    """
+    chosen: List[Tuple[int, int, float]] = []
+    last = -1
+    for i, chunk in enumerate(wa):
+        centre = (i * len(wb)) // len(wa)
+        best, best_j = 0.0, None
+        for j in range(max(last + 1, centre - 1), min(len(wb), centre + 2)):
+            found = score(chunk, wb[j])
+            if found > best:
+                best, best_j = found, j
+        if best_j is not None:
+            chosen.append((i, best_j, best))
+            last = best_j
+    return chosen
+
+
+def _line_blocks(a: Sequence[str], b: Sequence[str]) -> List[Tuple[int, int, int]]:
+    matcher = SequenceMatcher(a=a, b=b, autojunk=False)
+    return [block for block in matcher.get_matching_blocks() if block[2]]
+
+
+def matched_line_regions(
+    a: Sequence[str], b: Sequence[str], budget: Optional[Budget] = None
+) -> Optional[List[List[int]]]:
+    """Matched regions between two line-signature lists as ``[a_start, a_end, b_start, b_end]``.
+
+    Lines are 0-based and inclusive. Blank signatures are skipped while matching,
+    so a region may span blank or comment-only lines. With a ``budget``, inputs
+    over ``max_tokens`` non-blank lines are matched in aligned windows (regions
+    may then miss matches that cross windows), and ``None`` is returned when
+    either side exceeds ``max_region_lines``.
+    """
+    rows_a = [i for i, sig in enumerate(a) if sig]
+    rows_b = [j for j, sig in enumerate(b) if sig]
+    if budget is not None and max(len(rows_a), len(rows_b)) > budget.max_region_lines:
+        return None
+    if not rows_a or not rows_b:
+        return []
+    sig_a = [a[i] for i in rows_a]
+    sig_b = [b[j] for j in rows_b]
+
+    if budget is None or max(len(sig_a), len(sig_b)) <= budget.max_tokens:
+        blocks = _line_blocks(sig_a, sig_b)
+    else:
+        size = budget.token_window
+        wa = _windows(sig_a, size)
+        wb = _windows(sig_b, size)
+        seen: Dict[Tuple[int, int], List[Tuple[int, int, int]]] = {}
+
+        def _score(x: Sequence[str], y: Sequence[str]) -> float:
+            found = seen[(id(x), id(y))] = _line_blocks(x, y)
+            return float(sum(n for _, _, n in found))
+
+        blocks = []
+        for i, j, _ in _align_windows(wa, wb, _score):
+            blocks.extend((i * size + x, j * size + y, n) for x, y, n in seen[(id(wa[i]), id(wb[j]))])
+    return [[rows_a[i], rows_a[i + n - 1], rows_b[j], rows_b[j + n - 1]] for i, j, n in blocks]
+
+
+def _ratio(a: str, b: str, pair: Optional[PairBudget] = None) -> float:
     if not a and not b:
         return 1.0
+    if pair is not None:
+        return _bounded_ratio(a, b, pair)
     return float(SequenceMatcher(a=a, b=b).ratio())
 
 
-def type1_similarity(a: str, b: str) -> float:
-    return _ratio(a, b)
+def type1_similarity(a: str, b: str, pair: Optional[PairBudget] = None) -> float:
+    return _ratio(a, b, pair)
 
 
-def type2_similarity(a: str, b: str) -> float:
-    return _ratio(a, b)
+def type2_similarity(a: str, b: str, pair: Optional[PairBudget] = None) -> float:
+    return _ratio(a, b, pair)
 
 
-def type3_similarity(a: str, b: str) -> float:
+def type3_similarity(a: str, b: str, pair: Optional[PairBudget] = None) -> float:
     ta = tokenize_code(a)
     tb = tokenize_code(b)
+    if pair is not None:
+        return _bounded_ratio(ta, tb, pair)
     return float(SequenceMatcher(a=ta, b=tb).ratio())
 
 
-def type4_similarity(a: str, b: str) -> float:
+def type4_similarity(a: str, b: str, pair: Optional[PairBudget] = None) -> float:
     sig_a = ast_structure_signature(a)
     sig_b = ast_structure_signature(b)
+    if pair is not None:
+        return _bounded_ratio(sig_a, sig_b, pair)
     return sequence_similarity(sig_a, sig_b)
 
 
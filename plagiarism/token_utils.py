@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import io
+import keyword
 import re
 import tokenize
 from typing import Dict, List, Tuple
@@ -76,3 +77,112 @@ def tokenize_code(source: str) -> List[str]:
     except Exception:
         tokens = source.split()
     return tokens
+
+
+def physical_lines(source: str) -> List[str]:
+    """Split ``source`` into lines (with endings) the way ``tokenize`` counts them.
+
+    Unlike ``str.splitlines`` this does not break on form feeds, ``\\x1c`` or
+    ``\\u2028``, so line numbers agree with token positions.
+    """
+    return io.StringIO(source).readlines()
+
+
+def line_signatures(source: str) -> List[str]:
+    """One normalized token string per physical line, for line-level region matching.
+
+    Identifiers become ``ID`` and comments are dropped, so renamed copies still
+    line up; blank or comment-only lines map to an empty string.
+    """
+    lines = [line.rstrip("\r\n") for line in physical_lines(source)]
+    sigs: List[List[str]] = [[] for _ in lines]
+    reader = io.StringIO(source).readline
+    try:
+        for tok in tokenize.generate_tokens(reader):
+            tok_type, tok_str, start, _, _ = tok
+            if tok_type in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+                            tokenize.DEDENT, tokenize.ENDMARKER):
+                continue
+            row = start[0] - 1
+            if row >= len(sigs):
+                continue
+            if tok_type == tokenize.NAME and not keyword.iskeyword(tok_str):
+                sigs[row].append("ID")
+            else:
+                sigs[row].append(tok_str)
+    except Exception:
+        return [" ".join(line.split("#", 1)[0].split()) for line in lines]
+    return [" ".join(parts) for parts in sigs]
+
+
+_OPENERS = {"(": ")", "[": "]", "{": "}"}
+_LITERAL_OPS = {",", ":", "-", "+", "."}
+_LITERAL_NAMES = {"True", "False", "None"}
+
+
+def collapse_large_literals(source: str, max_tokens: int = 200, max_string_chars: int = 2000) -> str:
+    """Replace big constant-only displays and long string constants with ``...``.
+
+    A bracketed span counts as a literal block when every token inside it is a
+    number, string, ``True``/``False``/``None``, a nested bracket or one of
+    ``, : - + .``; it is collapsed when it holds more than ``max_tokens`` such
+    tokens. The result still parses, so AST-based comparison keeps working.
+    """
+    line_starts = [0]
+    for line in physical_lines(source):
+        line_starts.append(line_starts[-1] + len(line))
+
+    def _offset(pos: Tuple[int, int]) -> int:
+        return line_starts[pos[0] - 1] + pos[1]
+
+    spans: List[Tuple[int, int, str]] = []
+    # Each frame: [start offset, closing char, all-constant flag, constant count]
+    stack: List[List] = []
+    reader = io.StringIO(source).readline
+    try:
+        for tok in tokenize.generate_tokens(reader):
+            tok_type, tok_str, start, end, _ = tok
+            if tok_type == tokenize.OP and tok_str in _OPENERS:
+                stack.append([_offset(start), _OPENERS[tok_str], True, 0])
+                continue
+            if tok_type == tokenize.OP and stack and tok_str == stack[-1][1]:
+                begin, closer, all_const, count = stack.pop()
+                if all_const and count > max_tokens:
+                    spans.append((begin + 1, _offset(end) - 1, "..."))
+                if stack:
+                    stack[-1][2] = stack[-1][2] and all_const
+                    stack[-1][3] += count
+                continue
+            if tok_type == tokenize.STRING and len(tok_str) > max_string_chars:
+                # Keep the prefix (b, r, f, ...) so adjacent literals still concatenate.
+                prefix = tok_str[: len(tok_str) - len(tok_str.lstrip("bBrRuUfF"))]
+                spans.append((_offset(start), _offset(end), prefix + '"..."'))
+            if not stack:
+                continue
+            frame = stack[-1]
+            if tok_type in (tokenize.NUMBER, tokenize.STRING) or (
+                tok_type == tokenize.NAME and tok_str in _LITERAL_NAMES
+            ):
+                frame[3] += 1
+            elif tok_type in (tokenize.NL, tokenize.COMMENT) or (
+                tok_type == tokenize.OP and tok_str in _LITERAL_OPS
+            ):
+                continue
+            else:
+                frame[2] = False
+    except Exception:
+        return source
+
+    if not spans:
+        return source
+    # Keep only outermost spans, then splice from the end backwards.
+    spans.sort(key=lambda s: (s[0], -s[1]))
+    outer: List[Tuple[int, int, str]] = []
+    for span in spans:
+        if outer and span[1] <= outer[-1][1]:
+            continue
+        outer.append(span)
+    out = source
+    for begin, finish, repl in reversed(outer):
+        out = out[:begin] + repl + out[finish:]
+    return out
@@ -0,0 +1,394 @@
+"""Watch-folder mode: score new or changed submissions as they arrive.
+
+``IncrementalIndex`` keeps the preprocessed features of every file and the
+scores of every pair. Adding or changing one file only compares it against the
+files already indexed, so each arrival costs O(corpus) pair comparisons instead
+of a full O(n^2) rerun. ``watch`` polls a directory and feeds the index.
+
+With a ``FeatureCache`` the features and pair scores are also stored in SQLite
+keyed by content digest, so restarting the watcher reloads them instead of
+rescoring the corpus.
+
+Run with ``python -m plagiarism.watch submissions/ --output results.json``.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import fnmatch
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+import time
+from dataclasses import asdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .ast_utils import FunctionInfo, get_functions
+from .compare import (
+    SCORING_VERSION,
+    AnalyzedFile,
+    _prepare_files,
+    _prepare_functions,
+    _similarity_between_files,
+    _similarity_between_functions,
+)
+from .shard import DEFAULT_CLUSTER_THRESHOLD, cluster_edges
+from .similarity import DEFAULT_BUDGET, Budget
+
+PairKey = Tuple[str, str]
+
+DEFAULT_CACHE = ".plagiarism_watch.sqlite"
+DEFAULT_TOP_K = 500
+
+
+def _pair_key(a: str, b: str) -> PairKey:
+    return (a, b) if a <= b else (b, a)
+
+
+class FeatureCache:
+    """SQLite store of file features and pair scores keyed by content digest.
+
+    Entries are also keyed by a configuration hash (scoring version, weights,
+    budget, top-K), so changing any of them simply misses the old entries.
+    """
+
+    def __init__(self, path: str, config: Dict) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS features (key TEXT PRIMARY KEY, data TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pairs (key TEXT PRIMARY KEY, data TEXT)")
+        self._config = json.dumps(config, sort_keys=True)
+
+    def _key(self, *parts: str) -> str:
+        return hashlib.sha256("\0".join((self._config,) + parts).encode("utf-8")).hexdigest()
+
+    def _get(self, table: str, key: str) -> Optional[Dict]:
+        row = self.conn.execute(f"SELECT data FROM {table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, table: str, key: str, data: Dict) -> None:
+        self.conn.execute(f"INSERT OR REPLACE INTO {table} (key, data) VALUES (?, ?)", (key, json.dumps(data)))
+
+    def get_features(self, digest: str) -> Optional[Dict]:
+        return self._get("features", self._key("f", digest))
+
+    def put_features(self, digest: str, data: Dict) -> None:
+        self._put("features", self._key("f", digest), data)
+
+    def get_pair(self, digest_a: str, digest_b: str) -> Optional[Dict]:
+        return self._get("pairs", self._key("p", digest_a, digest_b))
+
+    def put_pair(self, digest_a: str, digest_b: str, data: Dict) -> None:
+        self._put("pairs", self._key("p", digest_a, digest_b), data)
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
+class _Ranking:
+    """Rows kept sorted by descending ``combined`` with O(log n) insert and remove."""
+
+    def __init__(self) -> None:
+        self._keys: List[Tuple[float, int]] = []
+        self._rows: Dict[int, Dict] = {}
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, row: Dict) -> int:
+        uid = self._next
+        self._next += 1
+        bisect.insort(self._keys, (-row["combined"], uid))
+        self._rows[uid] = row
+        return uid
+
+    def remove(self, uid: int) -> None:
+        row = self._rows.pop(uid)
+        del self._keys[bisect.bisect_left(self._keys, (-row["combined"], uid))]
+
+    def top(self, k: int) -> List[Dict]:
+        return [self._rows[uid] for _, uid in self._keys[:k]]
+
+
+def _with_names(rows: List[Dict], name_a: str, name_b: str) -> List[Dict]:
+    return [dict(row, file_a=name_a, file_b=name_b) for row in rows]
+
+
+class IncrementalIndex:
+    """Cached features plus ranked pair scores, updated one file at a time.
+
+    Only the best ``top_k`` function pairs of each file pair are kept, since no
+    others can reach the global top ``top_k``. File pairs at or above
+    ``cluster_threshold`` are tracked as edges, so clustering only visits them.
+    """
+
+    def __init__(
+        self,
+        weights: Tuple[float, float, float, float] = (0.25, 0.25, 0.25, 0.25),
+        budget: Optional[Budget] = DEFAULT_BUDGET,
+        top_k: int = DEFAULT_TOP_K,
+        cache_path: Optional[str] = None,
+        cluster_threshold: float = DEFAULT_CLUSTER_THRESHOLD,
+    ) -> None:
+        self.weights = weights
+        self.budget = budget
+        self.top_k = top_k
+        self.cluster_threshold = cluster_threshold
+        self.cache: Optional[FeatureCache] = None
+        if cache_path:
+            self.cache = FeatureCache(
+                cache_path,
+                {
+                    "version": SCORING_VERSION,
+                    "weights": [float(w) for w in weights],
+                    "budget": asdict(budget) if budget is not None else None,
+                    "top_k": top_k,
+                },
+            )
+        self._digests: Dict[str, str] = {}
+        self._prepared: Dict[str, AnalyzedFile] = {}
+        self._functions: Dict[str, List[FunctionInfo]] = {}
+        self._function_features: Dict[str, List[AnalyzedFile]] = {}
+        self._file_pairs: Dict[PairKey, Dict] = {}
+        self._file_uids: Dict[PairKey, int] = {}
+        self._edges: Dict[PairKey, None] = {}
+        self._function_uids: Dict[PairKey, List[int]] = {}
+        self._file_rank = _Ranking()
+        self._function_rank = _Ranking()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._prepared
+
+    def __len__(self) -> int:
+        return len(self._prepared)
+
+    def _features(self, name: str, source: str, digest: str) -> Tuple[AnalyzedFile, List[FunctionInfo]]:
+        cached = self.cache.get_features(digest) if self.cache is not None else None
+        if cached is not None:
+            item = AnalyzedFile(**dict(cached["file"], name=name))
+            funcs = [FunctionInfo(**dict(fn, filename=name)) for fn in cached["functions"]]
+            return item, funcs
+        item = _prepare_files({name: source}, self.budget)[0]
+        funcs = get_functions(source, filename=name)
+        if self.cache is not None:
+            self.cache.put_features(digest, {"file": asdict(item), "functions": [asdict(fn) for fn in funcs]})
+        return item, funcs
+
+    def _score_pair(self, name_a: str, name_b: str) -> Tuple[Dict, List[Dict]]:
+        digest_a, digest_b = self._digests[name_a], self._digests[name_b]
+        cached = self.cache.get_pair(digest_a, digest_b) if self.cache is not None else None
+        if cached is not None:
+            file_row = dict(cached["file"], file_a=name_a, file_b=name_b)
+            return file_row, _with_names(cached["functions"], name_a, name_b)
+
+        file_row = _similarity_between_files(self._prepared[name_a], self._prepared[name_b], self.weights, self.budget)
+        func_rows = heapq.nlargest(
+            self.top_k,
+            (
+                _similarity_between_functions(
+                    file_a=fa.filename,
+                    file_b=fb.filename,
+                    fa_source=fa.source,
+                    fb_source=fb.source,
+                    weights=self.weights,
+                    func_a_name=fa.name,
+                    func_b_name=fb.name,
+                    budget=self.budget,
+                    fa_prepared=pa,
+                    fb_prepared=pb,
+                )
+                for fa, pa in zip(self._functions[name_a], self._function_features[name_a])
+                for fb, pb in zip(self._functions[name_b], self._function_features[name_b])
+            ),
+            key=lambda r: r["combined"],
+        )
+        if self.cache is not None:
+            self.cache.put_pair(digest_a, digest_b, {"file": file_row, "functions": func_rows})
+        return file_row, func_rows
+
+    def update(self, name: str, source: str) -> bool:
+        """Index ``name``; returns False when its content is unchanged."""
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        if self._digests.get(name) == digest:
+            return False
+        self.remove(name)
+
+        item, funcs = self._features(name, source, digest)
+        self._digests[name] = digest
+        self._prepared[name] = item
+        self._functions[name] = funcs
+        self._function_features[name] = _prepare_functions(funcs, self.budget)
+        for other in self._prepared:
+            if other == name:
+                continue
+            key = _pair_key(name, other)
+            file_row, func_rows = self._score_pair(*key)
+            self._file_pairs[key] = file_row
+            self._file_uids[key] = self._file_rank.add(file_row)
+            if file_row["combined"] >= self.cluster_threshold:
+                self._edges[key] = None
+            self._function_uids[key] = [self._function_rank.add(row) for row in func_rows]
+        if self.cache is not None:
+            self.cache.commit()
+        return True
+
+    def remove(self, name: str) -> bool:
+        if name not in self._prepared:
+            return False
+        for other in self._prepared:
+            key = _pair_key(name, other)
+            if key not in self._file_pairs:
+                continue
+            del self._file_pairs[key]
+            self._edges.pop(key, None)
+            self._file_rank.remove(self._file_uids.pop(key))
+            for uid in self._function_uids.pop(key):
+                self._function_rank.remove(uid)
+        del self._prepared[name]
+        del self._functions[name]
+        del self._function_features[name]
+        del self._digests[name]
+        return True
+
+    def results(self, top_k: Optional[int] = None) -> Dict:
+        """Top-ranked pairs in the ``analyze_files`` result shape plus clusters.
+
+        ``top_k`` is capped at the index's own ``top_k``.
+        """
+        k = self.top_k if top_k is None else min(top_k, self.top_k)
+        return {
+            "file_pairs": self._file_rank.top(k),
+            "function_pairs": self._function_rank.top(k),
+            "clusters": cluster_edges(self._edges),
+        }
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+
+def scan_directory(directory: str, pattern: str = "*.py") -> Dict[str, Tuple[float, int]]:
+    """Return ``{relative path: (mtime, size)}`` for matching files under ``directory``."""
+    found: Dict[str, Tuple[float, int]] = {}
+    for root, _, names in os.walk(directory):
+        for fname in names:
+            if not fnmatch.fnmatch(fname, pattern):
+                continue
+            path = os.path.join(root, fname)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found[os.path.relpath(path, directory)] = (st.st_mtime, st.st_size)
+    return found
+
+
+def sync_directory(
+    index: IncrementalIndex,
+    directory: str,
+    seen: Dict[str, Tuple[float, int]],
+    pattern: str = "*.py",
+) -> Tuple[List[str], List[str]]:
+    """Bring ``index`` in line with ``directory``; returns ``(changed, removed)`` names."""
+    current = scan_directory(directory, pattern)
+    changed: List[str] = []
+    for name, stamp in sorted(current.items()):
+        if seen.get(name) == stamp:
+            continue
+        try:
+            with open(os.path.join(directory, name), "r", encoding="utf-8", errors="ignore") as fh:
+                source = fh.read()
+        except OSError:
+            continue
+        seen[name] = stamp
+        if index.update(name, source):
+            changed.append(name)
+    removed = [name for name in list(seen) if name not in current]
+    for name in removed:
+        del seen[name]
+        index.remove(name)
+    return changed, removed
+
+
+def watch(
+    directory: str,
+    index: Optional[IncrementalIndex] = None,
+    pattern: str = "*.py",
+    interval: float = 2.0,
+    on_change: Optional[Callable[[IncrementalIndex, List[str], List[str]], None]] = None,
+    iterations: Optional[int] = None,
+) -> IncrementalIndex:
+    """Poll ``directory`` every ``interval`` seconds and update ``index``.
+
+    ``on_change`` is called after each poll that added, changed or removed files.
+    ``iterations`` limits the number of polls (``None`` runs until interrupted).
+    """
+    index = index if index is not None else IncrementalIndex()
+    seen: Dict[str, Tuple[float, int]] = {}
+    polls = 0
+    while iterations is None or polls < iterations:
+        changed, removed = sync_directory(index, directory, seen, pattern)
+        if (changed or removed) and on_change is not None:
+            on_change(index, changed, removed)
+        polls += 1
+        if iterations is None or polls < iterations:
+            time.sleep(interval)
+    return index
+
+
+def _write_results(path: str, results: Dict) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2)
+    os.replace(tmp, path)
+
+
+def _print_summary(results: Dict, names: Iterable[str], limit: int = 5) -> None:
+    names = set(names)
+    for row in results["file_pairs"]:
+        if limit <= 0:
+            break
+        if row["file_a"] in names or row["file_b"] in names:
+            print(f"  {row['file_a']} <-> {row['file_b']}: {round(100.0 * row['combined'], 1)}%")
+            limit -= 1
+
+
+def main(argv: Optional[List[str]] = None) -> None:  # pragma: no cover - CLI entry
+    parser = argparse.ArgumentParser(description="Watch a folder and score submissions as they arrive.")
+    parser.add_argument("directory")
+    parser.add_argument("--pattern", default="*.py")
+    parser.add_argument("--interval", type=float, default=2.0, help="poll interval in seconds")
+    parser.add_argument("--output", default=None, help="JSON file rewritten after every change")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--cluster-threshold", type=float, default=DEFAULT_CLUSTER_THRESHOLD)
+    parser.add_argument(
+        "--cache", default=DEFAULT_CACHE, help="SQLite feature/score cache reused across restarts ('' to disable)"
+    )
+    args = parser.parse_args(argv)
+    index = IncrementalIndex(
+        top_k=args.top_k, cache_path=args.cache or None, cluster_threshold=args.cluster_threshold
+    )
+
+    def _on_change(index: IncrementalIndex, changed: List[str], removed: List[str]) -> None:
+        results = index.results(args.top_k)
+        print(f"[{time.strftime('%H:%M:%S')}] {len(index)} files, {len(changed)} new/changed, {len(removed)} removed")
+        _print_summary(results, changed)
+        if args.output:
+            _write_results(args.output, results)
+
+    try:
+        watch(args.directory, index=index, pattern=args.pattern, interval=args.interval, on_change=_on_change)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()